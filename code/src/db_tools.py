@@ -5,7 +5,10 @@ from sentence_transformers import SentenceTransformer
 import numpy as np
 import datetime
 import os
+import threading
+from typing import Optional
 from bson import ObjectId 
+from pymongo.errors import DuplicateKeyError
 
 
 # ------------------
@@ -21,10 +24,20 @@ class DatabaseConfig(BaseModel):
 # Core Implementation
 # ------------------
 class MemoryTools:
-    def __init__(self, config: DatabaseConfig):
+    NAMESPACE_FIELDS = ("repo", "team", "kind")
+
+    def __init__(self, config: DatabaseConfig, embedder=None, dedup_threshold: float = 0.95,
+                 compaction_threshold: float = 0.95):
         self.config = config
-        self.embedder = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+        # Any object with SentenceTransformer's encode(), e.g. the shared encoder service
+        self.embedder = embedder or SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+        self.dedup_threshold = dedup_threshold
+        self.compaction_threshold = compaction_threshold
+        self._stop_compaction = threading.Event()
+        # Identifies this process when taking the compaction lease
+        self._owner_id = str(ObjectId())
         self._init_clients()
+        self._init_indexes()
     
     def _init_clients(self):
         """Initialize MongoDB connections with pooling"""
@@ -46,6 +59,16 @@ class MemoryTools:
         except Exception as e:
             raise ConnectionError(f"MongoDB connection failed: {e}")
 
+    def _init_indexes(self):
+        """Index namespace fields so recall can pre-filter candidates"""
+        try:
+            collection = self.memories_client["smart_stubs_db"].memories
+            for field in self.NAMESPACE_FIELDS:
+                collection.create_index(field)
+            collection.create_index("timestamp")
+        except Exception as e:
+            print(f"Index error: {e}")
+
     # ------------------
     # Tool Schemas
     # ------------------
@@ -54,10 +77,16 @@ class MemoryTools:
 
     class RecordMemorySchema(BaseModel):
         input_str: str = Field(..., description="The information to remember")
+        repo: Optional[str] = Field(None, description="Repository the memory applies to, if any")
+        team: Optional[str] = Field(None, description="Team the memory applies to, if any")
+        kind: Optional[str] = Field(None, description="Kind of memory, e.g. instruction, config or analysis")
 
     class RecallMemorySchema(BaseModel):
         query_str: str = Field(..., description="The query to search memories")
         top_k: int = Field(3, description="Number of results to return")
+        repo: Optional[str] = Field(None, description="Only recall memories for this repository or untagged ones")
+        team: Optional[str] = Field(None, description="Only recall memories for this team or untagged ones")
+        kind: Optional[str] = Field(None, description="Only recall memories of this kind or untagged ones")
         
     class UpdateMemorySchema(BaseModel):
         memory_id: str = Field(..., description="The ID of the memory to update")
@@ -76,17 +105,68 @@ class MemoryTools:
             print(f"Fetch error: {e}")
             return []
 
-    def record_memory(self, input_str: str) -> str:
-        """Store memory with embedding"""
+    @staticmethod
+    def _similarities(query_embedding, memories) -> np.ndarray:
+        """Cosine similarity of the query against every memory"""
+        if not memories:
+            return np.array([])
+        matrix = np.array([memory["embedding"] for memory in memories])
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_embedding)
+        return matrix @ query_embedding / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def _merge_texts(texts) -> str:
+        """Join the texts, skipping any already contained in the merged text.
+
+        Near-identical memories can still differ in details, so no text is dropped.
+        """
+        merged = []
+        for text in texts:
+            if not any(text in kept for kept in merged):
+                merged.append(text)
+        return "\n".join(merged)
+
+    def record_memory(self, input_str: str, repo: Optional[str] = None, team: Optional[str] = None,
+                      kind: Optional[str] = None) -> str:
+        """Store memory with embedding, merging it into a near-identical memory in the same namespace.
+
+        As in compact_memories, the new text is merged with the existing one and the
+        previous version is kept in the memories_archive collection.
+        """
         try:
             db = self.memories_client["smart_stubs_db"]
             collection = db.memories
             
-            embedding = self.embedder.encode(input_str).tolist()
+            embedding = self.embedder.encode(input_str)
+            namespace = {"repo": repo, "team": team, "kind": kind}
+            now = datetime.datetime.utcnow()
+
+            candidates = list(collection.find(namespace))
+            similarities = self._similarities(embedding, candidates)
+            if len(similarities) and similarities.max() >= self.dedup_threshold:
+                existing = candidates[int(similarities.argmax())]
+                merged_text = self._merge_texts([input_str, existing["text"]])
+                # Matching on the old text skips the merge if the memory changed meanwhile
+                result = collection.update_one(
+                    {"_id": existing["_id"], "text": existing["text"]},
+                    {
+                        "$set": {
+                            "text": merged_text,
+                            "embedding": self.embedder.encode(merged_text).tolist(),
+                            "timestamp": now
+                        },
+                        "$inc": {"merge_count": 1}
+                    }
+                )
+                if result.matched_count == 1:
+                    self._archive(db.memories_archive, existing, existing["_id"])
+                    return str(existing["_id"])
+
             doc = {
                 "text": input_str,
-                "embedding": embedding,
-                "timestamp": datetime.datetime.utcnow()
+                "embedding": embedding.tolist(),
+                "timestamp": now,
+                **namespace
             }
             
             return str(collection.insert_one(doc).inserted_id)
@@ -94,23 +174,30 @@ class MemoryTools:
             print(f"Record error: {e}")
             return ""
 
-    def recall_memory(self, query_str: str, top_k: int = 3) -> list:
+    def recall_memory(self, query_str: str, top_k: int = 3, repo: Optional[str] = None,
+                      team: Optional[str] = None, kind: Optional[str] = None) -> list:
         """Find relevant memories using cosine similarity"""
         try:
             db = self.memories_client["smart_stubs_db"]
             collection = db.memories
             
+            # Untagged memories apply everywhere, so they stay candidates in every namespace
+            query = {}
+            for field, value in (("repo", repo), ("team", team), ("kind", kind)):
+                if value:
+                    query[field] = {"$in": [value, None]}
+
             query_embedding = self.embedder.encode(query_str)
-            all_memories = list(collection.find({}))
-            
-            similarities = []
-            for memory in all_memories:
-                mem_embedding = np.array(memory["embedding"])
-                similarity = np.dot(query_embedding, mem_embedding)
-                similarities.append((memory["text"], similarity, memory["_id"]))
-            
-            sorted_memories = sorted(similarities, key=lambda x: x[1], reverse=True)
-            return [{"text": text, "id": str(mem_id)} for text, _, mem_id in sorted_memories[:top_k]]
+            candidates = list(collection.find(query, {"text": 1, "embedding": 1}))
+            similarities = self._similarities(query_embedding, candidates)
+            top = [candidates[i] for i in np.argsort(-similarities)[:top_k]]
+
+            if top:
+                collection.update_many(
+                    {"_id": {"$in": [memory["_id"] for memory in top]}},
+                    {"$set": {"last_accessed": datetime.datetime.utcnow()}}
+                )
+            return [{"text": memory["text"], "id": str(memory["_id"])} for memory in top]
         except Exception as e:
             print(f"Recall error: {e}")
             return []
@@ -138,6 +225,131 @@ class MemoryTools:
             print(f"Update error: {e}")
             return False
 
+    # ------------------
+    # Maintenance
+    # ------------------
+    def compact_memories(self, stale_days: int = 30) -> int:
+        """Merge clusters of similar stale memories, returns the number of memories merged away.
+
+        The texts of each cluster are merged into its newest memory, which is re-embedded.
+        The merged-away memories are moved to the memories_archive collection. Every write
+        re-checks that the memory is still stale, so concurrent updates are never lost.
+        """
+        try:
+            db = self.memories_client["smart_stubs_db"]
+            collection = db.memories
+            archive = db.memories_archive
+
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=stale_days)
+            stale_filter = {
+                "timestamp": {"$lt": cutoff},
+                "$or": [{"last_accessed": {"$lt": cutoff}}, {"last_accessed": None}]
+            }
+            stale = list(collection.find(stale_filter, sort=[("timestamp", -1)]))
+
+            namespaces = {}
+            for memory in stale:
+                key = tuple(memory.get(field) for field in self.NAMESPACE_FIELDS)
+                namespaces.setdefault(key, []).append(memory)
+
+            removed = 0
+            for memories in namespaces.values():
+                while memories:
+                    # Memories are sorted newest first, so the newest of each cluster is kept
+                    keeper, rest = memories[0], memories[1:]
+                    similarities = self._similarities(np.array(keeper["embedding"]), rest)
+                    duplicates = [memory for memory, similarity in zip(rest, similarities)
+                                  if similarity >= self.compaction_threshold]
+                    if duplicates:
+                        removed += self._merge_into_keeper(collection, archive, keeper, duplicates, stale_filter)
+                    duplicate_ids = {memory["_id"] for memory in duplicates}
+                    memories = [memory for memory in rest if memory["_id"] not in duplicate_ids]
+            return removed
+        except Exception as e:
+            print(f"Compaction error: {e}")
+            return 0
+
+    @staticmethod
+    def _archive(archive, memory, merged_into):
+        """Keep a copy of a memory version, a memory can be archived more than once"""
+        doc = {key: value for key, value in memory.items() if key != "_id"}
+        archive.insert_one({**doc, "memory_id": memory["_id"], "merged_into": merged_into,
+                            "archived_at": datetime.datetime.utcnow()})
+
+    def _merge_into_keeper(self, collection, archive, keeper, duplicates, stale_filter) -> int:
+        """Merge duplicates that are still stale into the keeper, returns how many were merged"""
+        # Only documents still stale when deleted are merged, the rest were written meanwhile
+        merged = []
+        for duplicate in duplicates:
+            memory = collection.find_one_and_delete({"_id": duplicate["_id"], **stale_filter})
+            if memory is not None:
+                self._archive(archive, memory, keeper["_id"])
+                merged.append(memory)
+        if not merged:
+            return 0
+
+        # A keeper that is still stale still has the text read in the snapshot
+        merged_text = self._merge_texts([keeper["text"]] + [memory["text"] for memory in merged])
+        result = collection.update_one(
+            {"_id": keeper["_id"], **stale_filter},
+            {
+                "$set": {"text": merged_text, "embedding": self.embedder.encode(merged_text).tolist()},
+                "$inc": {"merge_count": sum(memory.get("merge_count", 0) + 1 for memory in merged)}
+            }
+        )
+        if result.matched_count == 0:
+            # The keeper was updated meanwhile, put the merged memories back untouched
+            collection.insert_many(merged)
+            archive.delete_many({"memory_id": {"$in": [memory["_id"] for memory in merged]},
+                                 "merged_into": keeper["_id"]})
+            return 0
+        return len(merged)
+
+    def _acquire_compaction_lease(self, lease_seconds: int) -> bool:
+        """Take the shared compaction lease so only one process compacts per interval"""
+        now = datetime.datetime.utcnow()
+        try:
+            self.memories_client["smart_stubs_db"].locks.find_one_and_update(
+                {"_id": "memory-compaction", "expires_at": {"$lt": now}},
+                {"$set": {"owner": self._owner_id, "expires_at": now + datetime.timedelta(seconds=lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Another process holds an unexpired lease
+            return False
+        except Exception as e:
+            print(f"Compaction lease error: {e}")
+            return False
+
+    def start_compaction(self, interval_seconds: int = 3600, stale_days: int = 30):
+        """Run compact_memories periodically on a daemon thread.
+
+        Every worker process may call this, a lease in the locks collection makes sure
+        only one of them compacts in each interval.
+        """
+        def run():
+            while not self._stop_compaction.wait(interval_seconds):
+                # The lease is held for the whole interval and never released early
+                if not self._acquire_compaction_lease(interval_seconds):
+                    continue
+                removed = self.compact_memories(stale_days)
+                if removed:
+                    print(f"Compacted {removed} memories")
+
+        thread = threading.Thread(target=run, name="memory-compaction", daemon=True)
+        thread.start()
+        return thread
+
+    def stop_compaction(self):
+        self._stop_compaction.set()
+
+    def get_memories_fingerprint(self, db_name="smart_stubs_db") -> tuple:
+        """Fingerprint of the memories collection: count and latest write time"""
+        collection = self.memories_client[db_name].memories
+        latest = collection.find_one({}, {"timestamp": 1}, sort=[("timestamp", -1)])
+        return (collection.count_documents({}), latest["timestamp"] if latest else None)
+
     # ------------------
     # Tool Generation
     # ------------------
@@ -152,13 +364,13 @@ class MemoryTools:
             StructuredTool.from_function(
                 self.record_memory,
                 name="RecordMemory",
-                description="EXCLUSIVELY USE THIS TO STORE NEW INFORMATION. Input format: exact text to remember and the context around it so that you can recall it later",
+                description="EXCLUSIVELY USE THIS TO STORE NEW INFORMATION. Input format: exact text to remember and the context around it so that you can recall it later. Tag it with the repo, team and kind it applies to when known. Near-identical memories are merged automatically",
                 args_schema=self.RecordMemorySchema
             ),
             StructuredTool.from_function(
                 self.recall_memory,
                 name="RecallMemory",
-                description="MUST USE FIRST FOR ANY QUESTION. This tool retrieves stored memories that match the provided query, ensuring relevant information is surfaced efficiently.",
+                description="MUST USE FIRST FOR ANY QUESTION. This tool retrieves stored memories that match the provided query, ensuring relevant information is surfaced efficiently. Pass repo, team or kind to narrow the search, untagged memories are always included.",
                 args_schema=self.RecallMemorySchema
             ),
             StructuredTool.from_function(
@@ -171,5 +383,6 @@ class MemoryTools:
 
     def _del_(self):
         """Cleanup connections"""
+        self.stop_compaction()
         self.payments_client.close()
         self.memories_client.close()
@@ -0,0 +1,89 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+
+# ------------------
+# Pool Processes
+# ------------------
+_model = None
+
+def _init_process(model_name):
+    """Load the model once per pool process"""
+    global _model
+    from sentence_transformers import SentenceTransformer
+    _model = SentenceTransformer(model_name)
+
+def _encode(sentences, normalize_embeddings):
+    return _model.encode(sentences, normalize_embeddings=normalize_embeddings)
+
+
+# ------------------
+# Service
+# ------------------
+class EncoderService:
+    """Shares a pool of encoder processes between all agent server workers.
+
+    The manager server handles every client connection in its own thread, so
+    concurrent requests from different workers are encoded in parallel.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, processes=None):
+        self.pool = ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_process,
+            initargs=(model_name,)
+        )
+
+    def encode(self, sentences, normalize_embeddings=False):
+        return self.pool.submit(_encode, sentences, normalize_embeddings).result()
+
+
+class EncoderManager(BaseManager):
+    pass
+
+
+class EncoderClient(BaseManager):
+    pass
+
+EncoderClient.register("get_encoder")
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+# ------------------
+# Client
+# ------------------
+class RemoteEncoder:
+    """Drop-in replacement for SentenceTransformer.encode backed by the encoder service"""
+
+    def __init__(self, address, authkey):
+        manager = EncoderClient(address=parse_address(address), authkey=authkey.encode())
+        manager.connect()
+        self.encoder = manager.get_encoder()
+
+    def encode(self, sentences, normalize_embeddings=False):
+        return self.encoder.encode(sentences, normalize_embeddings)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    service = EncoderService(processes=int(os.getenv("ENCODER_PROCESSES", os.cpu_count() or 1)))
+    EncoderManager.register("get_encoder", callable=lambda: service)
+    manager = EncoderManager(
+        address=parse_address(os.getenv("ENCODER_SERVICE_ADDRESS", "localhost:50051")),
+        authkey=os.getenv("ENCODER_SERVICE_AUTHKEY", "encoder").encode()
+    )
+    logger.info("Starting encoder service...")
+    manager.get_server().serve_forever()
@@ -86,6 +86,37 @@ class GitHubToolkit:
         file_content = repo.get_contents(filename)
         return file_content.decoded_content.decode()
 
+    # Fingerprints are kept to one or two API requests each, they run on every cache check
+    def _lazy_repo(self, repo_name):
+        return self.client.get_repo(f"{self.organization}/{repo_name.split('/')[-1]}", lazy=True)
+
+    def get_org_fingerprint(self, organization=None):
+        """Fingerprint of the organization: repository count and the most recently pushed repository"""
+        repos = self.org.get_repos(sort="pushed", direction="desc")
+        latest = repos.get_page(0)
+        if not latest:
+            return (0, None, None)
+        return (repos.totalCount, latest[0].name, str(latest[0].pushed_at))
+
+    def get_repo_head_sha(self, repo_name):
+        """Fingerprint of a repository: SHA at the head of its default branch"""
+        return self._lazy_repo(repo_name).get_commit("HEAD").sha
+
+    def get_repo_pulls_fingerprint(self, repo_name):
+        """Fingerprint of a repository's pull requests: the most recently updated one"""
+        pulls = self._lazy_repo(repo_name).get_pulls(state='all', sort='updated', direction='desc')
+        latest = pulls.get_page(0)
+        if not latest:
+            return (None, None)
+        # A new pull request is always the most recently updated one
+        return (latest[0].number, str(latest[0].updated_at))
+
+    def get_pr_fingerprint(self, pr_key):
+        """Fingerprint of a pull request: head SHA and last update time"""
+        repo_name, pr_number = pr_key
+        pr = self._lazy_repo(repo_name).get_pull(int(pr_number))
+        return (pr.head.sha, str(pr.updated_at))
+
     def create_bdd_repo_using_template(self, repo_name):
         template_repo_url = "https://github.com/GaurangRastogi/karate-bdd-template.git"  # Template repo URL
         new_repo = self.org.create_repo(repo_name)
@@ -80,6 +80,26 @@ class JIRAToolkit:
             issues.append([key, summary, description])
         return issues
     
+    def _search_updated(self, jql):
+        response = requests.request(
+            "GET",
+            self.api_url + "search/jql",
+            headers=self.headers,
+            params={'jql': jql, 'fields': ['updated']},
+            auth=self.auth
+        )
+        response.raise_for_status()
+        res = response.json().get("issues", [])
+        return sorted([issue["key"], issue["fields"].get("updated")] for issue in res)
+
+    def get_ticket_updated(self, ticket_id):
+        """Fingerprint of a ticket: its `updated` stamp"""
+        return self._search_updated(f"key ={ticket_id}  AND project = 'CPSX'")
+
+    def get_sprint_updated(self, project="CPSX"):
+        """Fingerprint of the current sprint: every ticket with its `updated` stamp"""
+        return self._search_updated(f"project = '{project}' AND sprint in openSprints()")
+
     def create_validation_ticket(self, summary, description):
         url = self.api_url + "issue"
         payload = json.dumps({
@@ -5,8 +5,13 @@ from langgraph.checkpoint.memory import MemorySaver
 from db_tools import DatabaseConfig, MemoryTools
 from jira_tools import JIRAToolkit
 from github_tools import GitHubToolkit
+from semantic_cache import SemanticCache
+from payload_store import PayloadStore, RedisPayloadStore
+from encoder_service import RemoteEncoder
+import gzip
+import sqlite3
 import uuid
-from flask import Flask
+from flask import Flask, Response, abort, request
 from flask_socketio import SocketIO
 from flask_cors import CORS
 from langchain_core.messages import ToolMessage, AIMessage
@@ -21,6 +26,10 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv()
 LLM_KEY = os.getenv("LLM_KEY")
+# Multi-worker deployment: Socket.IO message queue, shared checkpoints and shared encoder
+MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB")
+ENCODER_SERVICE_ADDRESS = os.getenv("ENCODER_SERVICE_ADDRESS")
 logger.info("Environment variables loaded.")
 
 # Initialize the LLM
@@ -47,14 +56,41 @@ config = DatabaseConfig(
 )
 logger.info("Database configuration initialized.")
 
+# Use the shared encoder service if one is running, otherwise load the model in-process
+embedder = None
+if ENCODER_SERVICE_ADDRESS:
+    embedder = RemoteEncoder(ENCODER_SERVICE_ADDRESS, os.getenv("ENCODER_SERVICE_AUTHKEY", "encoder"))
+    logger.info(f"Connected to encoder service at {ENCODER_SERVICE_ADDRESS}.")
+
 # Initialize tools
-memory_toolkit = MemoryTools(config)
+memory_toolkit = MemoryTools(
+    config,
+    embedder=embedder,
+    dedup_threshold=float(os.getenv("MEMORY_DEDUP_THRESHOLD", "0.95")),
+    compaction_threshold=float(os.getenv("MEMORY_COMPACTION_THRESHOLD", "0.95"))
+)
 tools = git_toolkit.generate_tools() + jira_toolkit.generate_tools() + memory_toolkit.generate_tools()
 logger.info("Tools initialized.")
 
-# Initialize the in-memory checkpointer
-checkpointer = MemorySaver()
-logger.info("In-memory checkpointer initialized.")
+# Opt-in background consolidation of similar memories nobody has used recently
+if os.getenv("MEMORY_COMPACTION_INTERVAL"):
+    memory_toolkit.start_compaction(
+        interval_seconds=int(os.getenv("MEMORY_COMPACTION_INTERVAL")),
+        stale_days=int(os.getenv("MEMORY_STALE_DAYS", "30"))
+    )
+    logger.info("Memory compaction started.")
+
+# Conversations must survive across worker processes when CHECKPOINT_DB is set
+if CHECKPOINT_DB:
+    # Shipped separately as langgraph-checkpoint-sqlite, only needed in this mode
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    checkpoint_conn = sqlite3.connect(CHECKPOINT_DB, check_same_thread=False)
+    checkpoint_conn.execute("PRAGMA journal_mode=WAL")
+    checkpointer = SqliteSaver(checkpoint_conn)
+    logger.info(f"SQLite checkpointer initialized at {CHECKPOINT_DB}.")
+else:
+    checkpointer = MemorySaver()
+    logger.info("In-memory checkpointer initialized.")
 
 
 prompt = """
@@ -78,29 +114,152 @@ agentic_system = create_react_agent(
 )
 logger.info("Agentic system created.")
 
+# Tools whose answers can be cached, mapped to the sources they read.
+# Any other tool (writes, forks, PRs, account dumps) makes the answer uncacheable.
+CACHE_SOURCES = {
+    "get_all_repo_names": lambda args: [("github_org", git_toolkit.organization)],
+    "get_repository_file_structure": lambda args: [("github_repo", args.get("repo_name"))],
+    "get_contents_of_file_in_repository": lambda args: [("github_repo", args.get("repo_name"))],
+    "get_all_pull_requests_in_repository": lambda args: [("github_pulls", args.get("repo_name"))],
+    "fetch_pr_details": lambda args: [("github_pr", (args.get("repo_name"), args.get("pr_number")))],
+    "get_ticket_details": lambda args: [("jira_ticket", args.get("ticket_id"))],
+    "get_all_tickets_for_current_sprint": lambda args: [("jira_sprint", "CPSX")],
+    "RecallMemory": lambda args: [("memories", "smart_stubs_db")],
+}
+
+# Opt-in semantic cache in front of the agent
+semantic_cache = None
+if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true":
+    semantic_cache = SemanticCache(
+        memory_toolkit.embedder,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256")),
+        revalidate_seconds=int(os.getenv("SEMANTIC_CACHE_REVALIDATE_SECONDS", "30"))
+    )
+    semantic_cache.register_source("github_org", git_toolkit.get_org_fingerprint)
+    semantic_cache.register_source("github_repo", git_toolkit.get_repo_head_sha)
+    semantic_cache.register_source("github_pulls", git_toolkit.get_repo_pulls_fingerprint)
+    semantic_cache.register_source("github_pr", git_toolkit.get_pr_fingerprint)
+    semantic_cache.register_source("jira_ticket", jira_toolkit.get_ticket_updated)
+    semantic_cache.register_source("jira_sprint", jira_toolkit.get_sprint_updated)
+    semantic_cache.register_source("memories", memory_toolkit.get_memories_fingerprint)
+    if semantic_cache.revalidate_seconds:
+        semantic_cache.start_revalidation()
+    logger.info("Semantic cache enabled.")
+
+# Large tool payloads are kept server-side and fetched over HTTP on demand
+payload_options = {
+    "inline_limit": int(os.getenv("PAYLOAD_INLINE_LIMIT", "4096")),
+    "preview_chars": int(os.getenv("PAYLOAD_PREVIEW_CHARS", "1024"))
+}
+if MESSAGE_QUEUE:
+    # Any worker may receive the HTTP request for the payload
+    payload_store = RedisPayloadStore(MESSAGE_QUEUE, **payload_options)
+else:
+    payload_store = PayloadStore(**payload_options)
+logger.info("Payload store initialized.")
+
 # Initialize Flask and SocketIO
 app = Flask(__name__)
 # Enable CORS for the Flask app
-CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}}, expose_headers=["Content-Range", "Content-Length"])
 # Update the Socket.IO initialization to allow CORS
-socketio = SocketIO(app, cors_allowed_origins="http://localhost:3000")
-thread_id=str(uuid.uuid4())
+socketio_options = {"cors_allowed_origins": "http://localhost:3000"}
+if MESSAGE_QUEUE:
+    # Websocket-only connections stay on one worker, so no sticky sessions are needed
+    socketio_options["message_queue"] = MESSAGE_QUEUE
+    socketio_options["transports"] = ["websocket"]
+socketio = SocketIO(app, **socketio_options)
+
+# Conversation thread of each connected client, keyed by Socket.IO session id
+thread_ids = {}
+
+@app.route('/payloads/<payload_id>', methods=['GET'])
+def get_payload(payload_id):
+    payload = payload_store.get(payload_id)
+    if payload is None:
+        abort(404)
+    data, mimetype, size = payload
+
+    # Payloads never change, serve the stored gzip body as is unless a range is requested.
+    # Ranges are only served on the identity body.
+    if request.range is None and "gzip" in request.accept_encodings:
+        response = Response(data, content_type=mimetype)
+        response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(f"{payload_id}-gzip")
+        accept_ranges = False
+    else:
+        response = Response(gzip.decompress(data), content_type=mimetype)
+        response.set_etag(payload_id)
+        accept_ranges = True
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "private, max-age=3600"
+    return response.make_conditional(request, accept_ranges=accept_ranges, complete_length=size)
 
 @socketio.on('connect', namespace='/socket')
 def handle_connect():
-    global thread_id
-    thread_id = str(uuid.uuid4())
     logger.info("Client connected to /socket")
 
 @socketio.on('disconnect', namespace='/socket')
 def handle_disconnect():
     logger.info("Client disconnected from /socket")
 
+def parse_thread_id(auth):
+    """Thread id sent by the client on connect, or None if missing or not a UUID"""
+    if not isinstance(auth, dict) or not isinstance(auth.get("thread_id"), str):
+        return None
+    try:
+        return str(uuid.UUID(auth["thread_id"]))
+    except ValueError:
+        return None
+
+@socketio.on('connect', namespace='/socket/chat')
+def handle_chat_connect(auth=None):
+    # Clients resume a conversation on any worker by sending its thread id
+    thread_ids[request.sid] = parse_thread_id(auth) or str(uuid.uuid4())
+    logger.info(f"Client connected to /socket/chat with thread {thread_ids[request.sid]}")
+
+@socketio.on('disconnect', namespace='/socket/chat')
+def handle_chat_disconnect():
+    thread_ids.pop(request.sid, None)
+    logger.info("Client disconnected from /socket/chat")
+
 @socketio.on('message', namespace='/socket/chat')
 def handle_message(data):
     logger.info(f"Received message: {data}")
-    # Process the message using the agentic system
+    sid = request.sid
+    thread_id = thread_ids.setdefault(sid, str(uuid.uuid4()))
     config = {"configurable": {"thread_id": thread_id}}
+
+    # Only the opening question of a conversation is cached, follow-ups depend on context
+    use_cache = (
+        semantic_cache is not None
+        and isinstance(data, str)
+        and not agentic_system.get_state(config).values.get("messages")
+    )
+    if use_cache:
+        cached_responses = semantic_cache.lookup(data)
+        if cached_responses is not None:
+            for response in cached_responses:
+                socketio.emit('response', response, namespace='/socket/chat', to=sid)
+            logger.info("Sent cached AI response")
+            # Keep the conversation history in sync so follow-ups have context
+            try:
+                agentic_system.update_state(
+                    config,
+                    {"messages": [("user", data)] + [("ai", response) for response in cached_responses]},
+                    as_node="agent"
+                )
+            except Exception as e:
+                logger.warning(f"Failed to record cached exchange: {e}")
+            socketio.emit('end', 'end-stream', namespace='/socket/chat', to=sid)
+            return
+
+    responses = []
+    fingerprints = {}
+    cacheable = use_cache
+
+    # Process the message using the agentic system
     events = agentic_system.stream(
         {"messages": [("user", data)]},
         config=config,
@@ -117,25 +276,41 @@ def handle_message(data):
                 socketio.emit('tool_response', {
                     "tool_name": message.name,
                     "tool_call_id": message.tool_call_id,
-                    "content": message.content
-                }, namespace='/socket/chat')
+                    **payload_store.offload(message.content)
+                }, namespace='/socket/chat', to=sid)
                 logger.info(f"Sent tool response: {message.tool_call_id}")
             else:
                 socketio.emit('tool_response', {
                     "tool_name": message.name,
-                    "content": message.content
-                }, namespace='/socket/chat')
+                    **payload_store.offload(message.content)
+                }, namespace='/socket/chat', to=sid)
                 logger.info(f"Sent tool response without tool_call_id: {message.name}")
 
         # Handle AIMessage
         elif isinstance(message, AIMessage):
             if message.content:
-                socketio.emit('response', message.content, namespace='/socket/chat')
+                socketio.emit('response', message.content, namespace='/socket/chat', to=sid)
+                responses.append(message.content)
                 logger.info(f"Sent AI response")
             if hasattr(message, "tool_calls") and message.tool_calls:
                 for tool_call in message.tool_calls:
-                    socketio.emit('tool_call', tool_call, namespace='/socket/chat')
+                    socketio.emit('tool_call', tool_call, namespace='/socket/chat', to=sid)
                     logger.info(f"Sent tool call: {tool_call}")
+                    if not cacheable:
+                        continue
+                    resolver = CACHE_SOURCES.get(tool_call["name"])
+                    if resolver is None:
+                        cacheable = False
+                        continue
+                    # Fingerprint before the tool runs so later changes invalidate the answer
+                    for source in resolver(tool_call.get("args") or {}):
+                        if source in fingerprints:
+                            continue
+                        fingerprint = semantic_cache.fingerprint(source, max_age=semantic_cache.revalidate_seconds)
+                        if fingerprint is None:
+                            cacheable = False
+                            break
+                        fingerprints[source] = fingerprint
 
         # Handle unexpected message types
         else:
@@ -145,7 +320,9 @@ def handle_message(data):
         socketio.sleep(0)
 
     logger.info("Finished processing all events.")
-    socketio.emit('end', 'end-stream', namespace='/socket/chat')
+    socketio.emit('end', 'end-stream', namespace='/socket/chat', to=sid)
+    if cacheable and semantic_cache.store(data, responses, fingerprints):
+        logger.info("Cached AI response")
 
 if __name__ == "__main__":
     logger.info("Starting SocketIO server...")
@@ -0,0 +1,108 @@
+import gzip
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------
+# Core Implementation
+# ------------------
+class PayloadStore:
+    """Server-side store for large tool payloads, kept gzip-compressed in memory.
+
+    The socket only carries a preview and the payload id, the full body is served
+    over HTTP. The oldest payloads are evicted once `max_bytes` of compressed data
+    is exceeded.
+    """
+
+    def __init__(self, inline_limit=4096, preview_chars=1024, max_bytes=256 * 1024 * 1024):
+        self.inline_limit = inline_limit
+        self.preview_chars = preview_chars
+        self.max_bytes = max_bytes
+        self.payloads = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _serialize(content):
+        """Tool content is either a string or a list of content blocks"""
+        if isinstance(content, str):
+            return content, "text/plain; charset=utf-8"
+        return json.dumps(content, default=str), "application/json"
+
+    def _store(self, raw, mimetype):
+        data = gzip.compress(raw, compresslevel=6)
+        payload_id = uuid.uuid4().hex
+        with self.lock:
+            self.payloads[payload_id] = (data, mimetype, len(raw))
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self.payloads) > 1:
+                _, (evicted, _, _) = self.payloads.popitem(last=False)
+                self.total_bytes -= len(evicted)
+        return payload_id
+
+    def put(self, content):
+        """Store a payload and return its id"""
+        text, mimetype = self._serialize(content)
+        return self._store(text.encode("utf-8"), mimetype)
+
+    def get(self, payload_id):
+        """Return (gzip data, mimetype, uncompressed size) or None if unknown or evicted"""
+        with self.lock:
+            return self.payloads.get(payload_id)
+
+    def offload(self, content):
+        """Build the socket payload for tool content, offloading it if it is large.
+
+        `content` is always a string, content blocks are sent JSON-encoded. Small
+        content is sent in full. Large content is stored and replaced by a preview,
+        the payload id and its full size. If the store is unavailable only the
+        preview is sent.
+        """
+        text, mimetype = self._serialize(content)
+        if len(text) <= self.inline_limit:
+            return {"content": text}
+        raw = text.encode("utf-8")
+        offloaded = {
+            "content": text[:self.preview_chars],
+            "truncated": True,
+            "payload_size": len(raw)
+        }
+        try:
+            offloaded["payload_id"] = self._store(raw, mimetype)
+        except Exception as e:
+            logger.warning(f"Failed to store tool payload, sending preview only: {e}")
+        return offloaded
+
+
+class RedisPayloadStore(PayloadStore):
+    """PayloadStore shared between worker processes through Redis.
+
+    Payloads expire after `ttl_seconds` instead of being evicted by size.
+    """
+
+    def __init__(self, url, ttl_seconds=3600, **kwargs):
+        super().__init__(**kwargs)
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def _store(self, raw, mimetype):
+        data = gzip.compress(raw, compresslevel=6)
+        payload_id = uuid.uuid4().hex
+        key = f"payload:{payload_id}"
+        pipeline = self.client.pipeline()
+        pipeline.hset(key, mapping={"data": data, "mimetype": mimetype, "size": len(raw)})
+        pipeline.expire(key, self.ttl_seconds)
+        pipeline.execute()
+        return payload_id
+
+    def get(self, payload_id):
+        data, mimetype, size = self.client.hmget(f"payload:{payload_id}", "data", "mimetype", "size")
+        if data is None:
+            return None
+        return data, mimetype.decode(), int(size)
@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------
+# Cache Entry
+# ------------------
+class CacheEntry:
+    def __init__(self, query_str, embedding, responses, fingerprints):
+        self.query_str = query_str
+        self.embedding = embedding
+        self.responses = responses
+        self.fingerprints = fingerprints
+        # Fingerprints were taken while the agent ran, so the first hit always checks them
+        self.validated_at = None
+
+
+# ------------------
+# Core Implementation
+# ------------------
+class SemanticCache:
+    """Replays answers for near-identical questions while their source data is unchanged.
+
+    Every entry remembers the sources (repos, Jira tickets, memories...) the agent read
+    while answering, together with a fingerprint of each one (head SHA, `updated` stamp)
+    taken before the agent read it. A background thread re-checks those fingerprints
+    every `revalidate_seconds` and drops entries whose sources changed, so hits are
+    served from memory. An answer may therefore be replayed for up to that long after
+    its sources change. With `revalidate_seconds=0` every hit is checked synchronously.
+    """
+
+    def __init__(self, embedder, threshold=0.92, max_entries=256, revalidate_seconds=30):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.revalidate_seconds = revalidate_seconds
+        self.fingerprinters = {}
+        # Recent fingerprints by source, as (fingerprint, monotonic time taken)
+        self.recent_fingerprints = {}
+        self.entries = []
+        self.lock = threading.Lock()
+        self._stop_revalidation = threading.Event()
+
+    def register_source(self, kind, fingerprint_fn):
+        """Register the function that fingerprints sources of the given kind"""
+        self.fingerprinters[kind] = fingerprint_fn
+
+    def _encode(self, query_str):
+        return self.embedder.encode(query_str.strip().lower(), normalize_embeddings=True)
+
+    def fingerprint(self, source, max_age=0):
+        """Fingerprint of a (kind, key) source, or None if it cannot be taken.
+
+        A fingerprint taken less than `max_age` seconds ago is reused. An outdated
+        fingerprint can only make a later check fail, never let a stale answer through.
+        """
+        if max_age:
+            with self.lock:
+                recent = self.recent_fingerprints.get(source)
+            if recent is not None and time.monotonic() - recent[1] < max_age:
+                return recent[0]
+
+        kind, key = source
+        fingerprint_fn = self.fingerprinters.get(kind)
+        if fingerprint_fn is None:
+            return None
+        try:
+            fingerprint = fingerprint_fn(key)
+        except Exception as e:
+            logger.warning(f"Fingerprint error for {source}: {e}")
+            return None
+        with self.lock:
+            self.recent_fingerprints[source] = (fingerprint, time.monotonic())
+        return fingerprint
+
+    def _validate(self, entry):
+        for source, fingerprint in entry.fingerprints.items():
+            if self.fingerprint(source) != fingerprint:
+                self.invalidate(entry)
+                return False
+        entry.validated_at = time.monotonic()
+        return True
+
+    def _is_fresh(self, entry):
+        if (self.revalidate_seconds and entry.validated_at is not None
+                and time.monotonic() - entry.validated_at < self.revalidate_seconds):
+            return True
+        return self._validate(entry)
+
+    # ------------------
+    # Core Operations
+    # ------------------
+    def lookup(self, query_str):
+        """Return the cached responses for a similar query, or None on a miss"""
+        query_embedding = self._encode(query_str)
+        with self.lock:
+            if not self.entries:
+                return None
+            matrix = np.stack([entry.embedding for entry in self.entries])
+            similarities = matrix @ query_embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            entry = self.entries[best]
+
+        # Fingerprinting hits the source APIs, so it runs outside the lock
+        if not self._is_fresh(entry):
+            return None
+        with self.lock:
+            # Most recently used entries live at the end of the list
+            if entry in self.entries:
+                self.entries.remove(entry)
+                self.entries.append(entry)
+        return list(entry.responses)
+
+    def store(self, query_str, responses, fingerprints):
+        """Cache the responses for a query with the fingerprints of the sources it read"""
+        # Without sources an answer could never be invalidated
+        if not responses or not fingerprints:
+            return False
+
+        entry = CacheEntry(query_str, self._encode(query_str), list(responses), dict(fingerprints))
+        with self.lock:
+            self.entries.append(entry)
+            if len(self.entries) > self.max_entries:
+                self.entries.pop(0)
+        return True
+
+    def invalidate(self, entry):
+        with self.lock:
+            if entry in self.entries:
+                self.entries.remove(entry)
+
+    def clear(self):
+        with self.lock:
+            self.entries = []
+
+    # ------------------
+    # Background Revalidation
+    # ------------------
+    def revalidate(self):
+        """Check every entry against fresh fingerprints, each source is fetched once"""
+        with self.lock:
+            entries = list(self.entries)
+            self.recent_fingerprints = {}
+        for entry in entries:
+            # Sources shared with entries checked earlier in this sweep reuse their fingerprint
+            for source, fingerprint in entry.fingerprints.items():
+                if self.fingerprint(source, max_age=self.revalidate_seconds) != fingerprint:
+                    self.invalidate(entry)
+                    break
+            else:
+                entry.validated_at = time.monotonic()
+
+    def start_revalidation(self):
+        """Run revalidate on a daemon thread, often enough that hits never wait on it"""
+        def run():
+            while not self._stop_revalidation.wait(self.revalidate_seconds / 2):
+                try:
+                    self.revalidate()
+                except Exception as e:
+                    logger.warning(f"Revalidation error: {e}")
+
+        thread = threading.Thread(target=run, name="semantic-cache-revalidation", daemon=True)
+        thread.start()
+        return thread
+
+    def stop_revalidation(self):
+        self._stop_revalidation.set()
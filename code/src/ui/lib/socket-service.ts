@@ -2,11 +2,16 @@ import { io, type Socket } from "socket.io-client"
 
 let socket: Socket | null = null
 
+// Conversation id sent on every reconnect so any server worker can resume the conversation.
+// It lives only for this page load, a reload starts a new conversation.
+const threadId = crypto.randomUUID()
+
 export const initializeSocket = () => {
   if (!socket) {
     socket = io("http://localhost:12345/socket/chat", { // Connect to /socket/chat namespace
       path: "/socket.io", // Default Socket.IO path
       transports: ["websocket"], // Use WebSocket transport to avoid polling
+      auth: { thread_id: threadId },
     })
 
     socket.on("connect", () => {